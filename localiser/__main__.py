@@ -3,25 +3,368 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import argparse
-import json
+import logging
+import queue
 import sys
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 
-from .config import load_settings
-from .db import apply_patch_and_finish, claim_one, get_collection, unlock_with_error
-from .llm_client import LlmSettings
-from .translator import translate_document
+import orjson
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .config import Settings, load_settings
+from .db import (
+    Claim,
+    ClaimQueue,
+    apply_patches_bulk,
+    ensure_claim_indexes,
+    get_collection,
+    patch_and_finish_op,
+    still_locked,
+    unlock_with_error,
+)
+from .llm_client import LlmError, LlmResponseError, LlmSettings
+from .translator import (
+    BatchTranslationError,
+    has_translatable_strings,
+    translate_document,
+    translate_documents,
+)
 from .validate import ValidationError, validate_and_build_patch
 
 
+_logger = logging.getLogger("localiser")
+
+
+class _JsonFormatter(logging.Formatter):
+    """Render the dict passed to _log as one JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return orjson.dumps(record.msg, default=str).decode()
+
+
+def _start_logging() -> tuple[QueueHandler, QueueListener]:
+    # Workers only encode and enqueue; a single listener thread does the stdout writes,
+    # so threads never contend on the stream.
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(_JsonFormatter())
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+
+    _logger.addHandler(queue_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+    listener.start()
+    return queue_handler, listener
+
+
+def _stop_logging(queue_handler: QueueHandler, listener: QueueListener) -> None:
+    listener.stop()  # drains anything still queued
+    _logger.removeHandler(queue_handler)
+
+
 def _log(obj: dict) -> None:
-    print(json.dumps(obj, ensure_ascii=False), flush=True)
+    _logger.info(obj)
+
+
+def _translate_claims(
+    claims: list[Claim], *, llm: LlmSettings, s: Settings
+) -> list[dict | Exception]:
+    """Translate a batch of claims, returning a translated doc or the error per claim.
+
+    The whole batch goes out in one LLM call; documents whose part of the response can't
+    be used are retried on their own so one bad document doesn't fail the rest. Request
+    failures (server down, timeouts, HTTP errors) are not retried per document, and stop
+    the retries for the rest of the batch.
+    """
+    docs = [c.doc for c in claims]
+    ids = [str(d.get("_id")) for d in docs]
+    kwargs = dict(
+        llm=llm,
+        source_locale=s.source_locale,
+        target_locale=s.target_locale,
+        locale_field=s.mongodb_locale_field,
+    )
+
+    _log({"event": "llm_translate_start", "_ids": ids})
+    results = translate_documents(docs=docs, **kwargs)
+
+    retry = [i for i, r in enumerate(results) if isinstance(r, BatchTranslationError)]
+    if retry:
+        _log(
+            {
+                "event": "batch_fallback",
+                "_ids": [ids[i] for i in retry],
+                "message": str(results[retry[0]]),
+            }
+        )
+    request_error: LlmError | None = None
+    for i in retry:
+        # Once the server itself is failing, don't spend a timeout on every remaining doc.
+        if request_error is not None:
+            results[i] = request_error
+            continue
+        try:
+            results[i] = translate_document(doc=docs[i], **kwargs)
+        except Exception as e:
+            results[i] = e
+            if isinstance(e, LlmError) and not isinstance(e, LlmResponseError):
+                request_error = e
+    return results
+
+
+def _finish_claim(
+    col,
+    claim: Claim,
+    result: dict | Exception,
+    *,
+    s: Settings,
+    dry_run: bool,
+    skip_on_error: bool,
+) -> UpdateOne | None:
+    """Validate one translated claim and return its Mongo update, or None if nothing to write.
+
+    Errors are logged and the document unlocked (or, with --skip-on-error, its update is
+    returned so it gets marked as done).
+    """
+    doc = claim.doc
+    _id = doc.get("_id")
+
+    try:
+        if isinstance(result, Exception):
+            raise result
+        translated = result
+
+        # Helpful visibility when the model returns the doc unchanged.
+        _log(
+            {
+                "event": "llm_translate_done",
+                "_id": str(_id),
+                "translated_same_as_input": translated == doc,
+            }
+        )
+        diff = validate_and_build_patch(
+            original_doc=doc,
+            translated_doc=translated,
+            locale_field=s.mongodb_locale_field,
+        )
+
+        # Never advance locale unless we actually changed some user-facing strings,
+        # except for documents that had nothing to translate in the first place.
+        if len(diff.set_ops) == 0:
+            if has_translatable_strings(doc, locale_field=s.mongodb_locale_field):
+                raise ValidationError(
+                    "No translatable strings changed; refusing to set locale to target."
+                )
+            _log({"event": "no_translatable_strings", "_id": str(_id)})
+
+        _log(
+            {
+                "_id": str(_id),
+                "changed_paths": diff.changed_paths,
+                "changed_count": len(diff.changed_paths),
+                "dry_run": dry_run,
+            }
+        )
+
+        if dry_run:
+            return None
+        return patch_and_finish_op(
+            _id=_id,
+            lock_field=s.lock_field,
+            owner=claim.owner,
+            locale_field=s.mongodb_locale_field,
+            target_locale=s.target_locale,
+            processed_mark_field=s.processed_mark_field,
+            set_ops=diff.set_ops,
+        )
+
+    except (ValidationError, Exception) as e:
+        _log({"event": "error", "_id": str(_id), "message": str(e)})
+
+        # Prevent hot-looping the same problematic documents.
+        if skip_on_error and not dry_run:
+            return patch_and_finish_op(
+                _id=_id,
+                lock_field=s.lock_field,
+                owner=claim.owner,
+                locale_field=s.mongodb_locale_field,
+                target_locale=s.target_locale,
+                processed_mark_field=s.processed_mark_field,
+                set_ops={s.error_field: {"message": str(e)}},
+            )
+        unlock_with_error(
+            col,
+            _id=_id,
+            lock_field=s.lock_field,
+            owner=claim.owner,
+            error_field=s.error_field,
+            error_message=str(e),
+        )
+        return None
+
+
+def _write_patches(col, finished: list[tuple[Claim, UpdateOne]], *, s: Settings) -> None:
+    """Bulk-write finished claims; docs whose update didn't apply are unlocked with an error."""
+    if not finished:
+        return
+
+    claims = [claim for claim, _ in finished]
+    errors: dict[int, str] = {}
+    try:
+        modified = apply_patches_bulk(col, [op for _, op in finished])
+    except BulkWriteError as e:
+        errors = {
+            err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])
+        }
+        modified = int(e.details.get("nModified", 0))
+    except Exception as e:
+        errors = {i: f"Bulk update failed: {e}" for i in range(len(claims))}
+        modified = 0
+
+    if not errors and modified == len(claims):
+        return
+
+    for i, message in errors.items():
+        _log({"event": "error", "_id": str(claims[i].doc.get("_id")), "message": message})
+
+    try:
+        # Anything we still hold the lock on wasn't written: record why and release it, as a
+        # failed single update would have been.
+        unwritten = still_locked(col, claims, lock_field=s.lock_field)
+        messages = {claims[i].doc.get("_id"): message for i, message in errors.items()}
+        for claim in unwritten:
+            message = messages.get(claim.doc.get("_id"), "Update failed (document changed)")
+            unlock_with_error(
+                col,
+                _id=claim.doc.get("_id"),
+                lock_field=s.lock_field,
+                owner=claim.owner,
+                error_field=s.error_field,
+                error_message=message,
+            )
+    except Exception as e:
+        _log({"event": "error", "message": f"Could not unlock failed updates: {e}"})
+        return
+
+    lost = len(claims) - modified - len(unwritten)
+    if lost > 0:
+        # Matched nothing and no longer ours: the lock expired and another worker took over.
+        _log({"event": "error", "message": f"{lost} documents lost their lock before the update"})
+
+
+def _backoff_s(failures: int) -> float:
+    """Exponential backoff for consecutive LLM failures, capped at 5s."""
+    return min(0.05 * 2**failures, 5.0)
+
+
+class _Progress:
+    """Processed-document counter shared by workers; enforces --max-docs across them."""
+
+    def __init__(self, max_docs: int | None) -> None:
+        self.max_docs = max_docs
+        self.processed = 0
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n: int) -> int:
+        """Reserve up to `n` documents of the max-docs budget; returns how many were granted."""
+        with self._lock:
+            if self.max_docs is None:
+                return n
+            granted = max(0, min(n, self.max_docs - self._reserved))
+            self._reserved += granted
+            return granted
+
+    def release(self, n: int) -> None:
+        with self._lock:
+            if self.max_docs is not None:
+                self._reserved -= n
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self.processed += n
+
+
+def _run_worker(
+    worker: int,
+    col,
+    llm: LlmSettings,
+    s: Settings,
+    progress: _Progress,
+    claim_queue: ClaimQueue,
+    stop: threading.Event,
+    *,
+    dry_run: bool,
+    skip_on_error: bool,
+) -> None:
+    failures = 0
+    while True:
+        if stop.is_set():
+            _log({"event": "done", "worker": worker, "reason": "stopped"})
+            return
+
+        batch_size = progress.reserve(s.batch_size)
+        if batch_size == 0:
+            _log(
+                {
+                    "event": "done",
+                    "worker": worker,
+                    "reason": "max_docs_reached",
+                    "processed": progress.processed,
+                }
+            )
+            return
+
+        _log(
+            {
+                "event": "claim_attempt",
+                "worker": worker,
+                "processed": progress.processed,
+                "batch_size": batch_size,
+            }
+        )
+        claims = claim_queue.take(batch_size)
+        progress.release(batch_size - len(claims))
+        if not claims:
+            _log({"event": "done", "worker": worker, "reason": "no_more_source_locale_docs"})
+            return
+
+        ids = [str(c.doc.get("_id")) for c in claims]
+        _log({"event": "claimed", "worker": worker, "_ids": ids})
+
+        results = _translate_claims(claims, llm=llm, s=s)
+        # Bad output (LlmResponseError) won't improve by waiting; an unreachable server might.
+        llm_failed = any(
+            isinstance(r, LlmError) and not isinstance(r, LlmResponseError) for r in results
+        )
+        finished: list[tuple[Claim, UpdateOne]] = []
+        for claim, result in zip(claims, results):
+            op = _finish_claim(
+                col, claim, result, s=s, dry_run=dry_run, skip_on_error=skip_on_error
+            )
+            if op is not None:
+                finished.append((claim, op))
+
+        _write_patches(col, finished, s=s)
+        progress.add(len(claims))
+
+        # Back off only when the LLM request itself is failing (e.g. server warming up or
+        # overloaded); validation failures and malformed output won't fix themselves by waiting.
+        if llm_failed:
+            failures += 1
+            stop.wait(_backoff_s(failures))
+        else:
+            failures = 0
 
 
 def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(prog="localiser")
     parser.add_argument("--max-docs", type=int, default=None)
     parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
     parser.add_argument(
         "--skip-on-error",
         action="store_true",
@@ -29,128 +372,76 @@ def main(argv: list[str] | None = None) -> int:
     )
     args = parser.parse_args(argv)
 
+    queue_handler, listener = _start_logging()
+    try:
+        return _run(args)
+    finally:
+        _stop_logging(queue_handler, listener)
+
+
+def _run(args: argparse.Namespace) -> int:
     s = load_settings()
     max_docs = args.max_docs if args.max_docs is not None else s.max_docs
     dry_run = args.dry_run or s.dry_run
     skip_on_error = args.skip_on_error
 
+    workers = max(1, args.workers if args.workers is not None else s.workers)
+
     llm = LlmSettings(
         base_url=s.lmstudio_base_url,
         model=s.lmstudio_model,
         api_key=s.lmstudio_api_key,
         timeout_s=s.lmstudio_timeout_s,
         temperature=s.llm_temperature,
+        max_connections=workers,
+        stream=s.llm_stream,
     )
 
     col = get_collection(s.mongodb_uri, s.mongodb_db, s.mongodb_collection)
+    ensure_claim_indexes(col, locale_field=s.mongodb_locale_field, lock_field=s.lock_field)
 
-    processed = 0
-    while True:
-        if max_docs is not None and processed >= max_docs:
-            _log({"event": "done", "reason": "max_docs_reached", "processed": processed})
-            break
-
-        _log({"event": "claim_attempt", "processed": processed})
-        claim = claim_one(
-            col,
-            locale_field=s.mongodb_locale_field,
-            source_locale=s.source_locale,
-            lock_field=s.lock_field,
-            lock_lease_s=s.lock_lease_s,
-            error_field=s.error_field,
-        )
-        if claim is None:
-            _log({"event": "done", "reason": "no_more_source_locale_docs"})
-            break
-
-        doc = claim.doc
-        _id = doc.get("_id")
-
-        _log({"event": "claimed", "_id": str(_id)})
-
-        try:
-            _log({"event": "llm_translate_start", "_id": str(_id)})
-            translated = translate_document(
-                doc=doc,
-                llm=llm,
-                source_locale=s.source_locale,
-                target_locale=s.target_locale,
-                locale_field=s.mongodb_locale_field,
-            )
-            # Helpful visibility when the model returns the doc unchanged.
-            _log(
-                {
-                    "event": "llm_translate_done",
-                    "_id": str(_id),
-                    "translated_same_as_input": translated == doc,
-                }
-            )
-            diff = validate_and_build_patch(
-                original_doc=doc,
-                translated_doc=translated,
-                locale_field=s.mongodb_locale_field,
-            )
-
-            # Never advance locale unless we actually changed some user-facing strings.
-            if len(diff.set_ops) == 0:
-                raise ValidationError(
-                    "No translatable strings changed; refusing to set locale to target."
-                )
-
-            _log(
-                {
-                    "_id": str(_id),
-                    "changed_paths": diff.changed_paths,
-                    "changed_count": len(diff.changed_paths),
-                    "dry_run": dry_run,
-                }
-            )
-
-            if not dry_run:
-                modified = apply_patch_and_finish(
-                    col,
-                    _id=_id,
-                    lock_field=s.lock_field,
-                    owner=claim.owner,
-                    locale_field=s.mongodb_locale_field,
-                    target_locale=s.target_locale,
-                    processed_mark_field=s.processed_mark_field,
-                    set_ops=diff.set_ops,
-                )
-                if modified != 1:
-                    raise RuntimeError("Update failed (lock lost or document changed)")
-
-            processed += 1
-
-        except (ValidationError, Exception) as e:
-            processed += 1
-            _log({"event": "error", "_id": str(_id), "message": str(e)})
-
-            # Prevent hot-looping the same problematic documents.
-            if skip_on_error and not dry_run:
-                apply_patch_and_finish(
-                    col,
-                    _id=_id,
-                    lock_field=s.lock_field,
-                    owner=claim.owner,
-                    locale_field=s.mongodb_locale_field,
-                    target_locale=s.target_locale,
-                    processed_mark_field=s.processed_mark_field,
-                    set_ops={s.error_field: {"message": str(e)}},
-                )
-            else:
-                unlock_with_error(
+    progress = _Progress(max_docs)
+    # One burst claims a batch for every worker; `limit` keeps refills within --max-docs.
+    claim_queue = ClaimQueue(
+        col,
+        burst=workers * s.batch_size,
+        limit=max_docs,
+        locale_field=s.mongodb_locale_field,
+        source_locale=s.source_locale,
+        lock_field=s.lock_field,
+        lock_lease_s=s.lock_lease_s,
+        error_field=s.error_field,
+    )
+    stop = threading.Event()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="localiser") as pool:
+            futures = [
+                pool.submit(
+                    _run_worker,
+                    worker,
                     col,
-                    _id=_id,
-                    lock_field=s.lock_field,
-                    owner=claim.owner,
-                    error_field=s.error_field,
-                    error_message=str(e),
+                    llm,
+                    s,
+                    progress,
+                    claim_queue,
+                    stop,
+                    dry_run=dry_run,
+                    skip_on_error=skip_on_error,
                 )
+                for worker in range(workers)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Ctrl-C or a failed worker: let the others finish their current batch and
+                # exit, rather than the pool waiting for them to drain the whole queue.
+                stop.set()
+                raise
+    finally:
+        claim_queue.release()
 
-            # avoid hot loop on repeatedly failing docs
-            time.sleep(0.2)
-
+    _log({"event": "finished", "processed": progress.processed, "workers": workers})
     return 0
 
 
@@ -42,9 +42,12 @@ class Settings:
 
     max_docs: int | None
     dry_run: bool
+    batch_size: int
+    workers: int
 
     llm_max_retries: int
     llm_temperature: float
+    llm_stream: bool
 
     lock_field: str
     lock_lease_s: int
@@ -87,8 +90,11 @@ def load_settings() -> Settings:
         target_locale=_getenv("TARGET_LOCALE", "de-DE") or "de-DE",
         max_docs=(lambda v: int(v) if v is not None else None)(_getenv("MAX_DOCS")),
         dry_run=_getenv_bool("DRY_RUN", False),
+        batch_size=max(1, _getenv_int("BATCH_SIZE", 8)),
+        workers=max(1, _getenv_int("WORKERS", 1)),
         llm_max_retries=_getenv_int("LLM_MAX_RETRIES", 3),
         llm_temperature=float(_getenv("LLM_TEMPERATURE", "0.2") or "0.2"),
+        llm_stream=_getenv_bool("LLM_STREAM", True),
         lock_field=_getenv("LOCK_FIELD", "_localiserLock") or "_localiserLock",
         lock_lease_s=_getenv_int("LOCK_LEASE_S", 300),
         processed_mark_field=_getenv("PROCESSED_MARK_FIELD", "_localiserProcessedAt")
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import threading
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any
 from uuid import uuid4
 
-from pymongo import MongoClient, ReturnDocument
+from pymongo import MongoClient, UpdateOne
 from pymongo.collection import Collection
 
 
@@ -25,19 +27,23 @@ def get_collection(mongodb_uri: str, db_name: str, collection_name: str) -> Coll
     return client[db_name][collection_name]
 
 
-def claim_one(
-    collection: Collection,
+def ensure_claim_indexes(collection: Collection, *, locale_field: str, lock_field: str) -> None:
+    """Create the indexes claim queries rely on (no-op if they already exist).
+
+    Without them every claim is a collection scan over the locale filter and `_id` sort.
+    """
+    collection.create_index([(locale_field, 1), ("_id", 1)])
+    collection.create_index([(locale_field, 1), (f"{lock_field}.expiresAt", 1)])
+
+
+def _claimable_filter(
     *,
     locale_field: str,
     source_locale: str,
     lock_field: str,
-    lock_lease_s: int,
-    error_field: str = "_localiserLastError",
-) -> Claim | None:
-    now = utcnow()
-    expires_at = now + timedelta(seconds=lock_lease_s)
-    owner = str(uuid4())
-
+    error_field: str,
+    now: datetime,
+) -> dict[str, Any]:
     lock_available_filter = {
         "$or": [
             {lock_field: {"$exists": False}},
@@ -55,25 +61,122 @@ def claim_one(
         ]
     }
 
-    res = collection.find_one_and_update(
-        filter={locale_field: source_locale, **lock_available_filter, **not_errored_filter},
-        update={
-            "$set": {
-                lock_field: {
-                    "owner": owner,
-                    "lockedAt": now,
-                    "expiresAt": expires_at,
-                }
-            }
-        },
-        sort=[("_id", 1)],
-        return_document=ReturnDocument.AFTER,
-    )
+    # Both sub-filters are `$or`s, so they must be combined under `$and` rather than
+    # merged into one dict (which would silently drop the lock check).
+    return {locale_field: source_locale, "$and": [lock_available_filter, not_errored_filter]}
 
-    if res is None:
-        return None
 
-    return Claim(owner=owner, doc=res)
+def claim_many(
+    collection: Collection,
+    n: int,
+    *,
+    locale_field: str,
+    source_locale: str,
+    lock_field: str,
+    lock_lease_s: int,
+    error_field: str = "_localiserLastError",
+) -> list[Claim]:
+    """Claim up to `n` documents in three round-trips, however large `n` is.
+
+    Mark-and-read: find candidate ids, lock them all with one `update_many` (which re-checks
+    the claimable filter, so a document another worker grabbed in between is skipped), then
+    read back the documents carrying our owner id. An empty list means nothing is left.
+    """
+    while True:
+        now = utcnow()
+        expires_at = now + timedelta(seconds=lock_lease_s)
+        owner = str(uuid4())
+        claimable = _claimable_filter(
+            locale_field=locale_field,
+            source_locale=source_locale,
+            lock_field=lock_field,
+            error_field=error_field,
+            now=now,
+        )
+
+        ids = [d["_id"] for d in collection.find(claimable, {"_id": 1}, sort=[("_id", 1)], limit=n)]
+        if not ids:
+            return []
+
+        collection.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {lock_field: {"owner": owner, "lockedAt": now, "expiresAt": expires_at}}},
+        )
+        docs = collection.find({"_id": {"$in": ids}, f"{lock_field}.owner": owner}, sort=[("_id", 1)])
+        claims = [Claim(owner=owner, doc=doc) for doc in docs]
+        if claims:
+            return claims
+        # Every candidate was claimed by another worker first; look again.
+
+
+class ClaimQueue:
+    """Claims shared by all workers, refilled in bursts so claim round-trips are amortised.
+
+    Refills happen on demand (by whichever worker finds the buffer empty) rather than from a
+    background thread, so prefetched claims don't sit idle burning their lock lease. With a
+    `limit`, no more than that many documents are ever claimed over the queue's lifetime.
+    """
+
+    def __init__(
+        self,
+        collection: Collection,
+        *,
+        burst: int,
+        lock_field: str,
+        limit: int | None = None,
+        **claim_kwargs: Any,
+    ) -> None:
+        self._collection = collection
+        self._burst = burst
+        self._remaining = limit
+        self._lock_field = lock_field
+        self._claim_kwargs = claim_kwargs
+        self._buffer: deque[Claim] = deque()
+        self._mutex = threading.Lock()
+
+    def take(self, n: int) -> list[Claim]:
+        """Return up to `n` claims; an empty list means nothing is left to claim."""
+        with self._mutex:
+            if not self._buffer:
+                size = max(n, self._burst)
+                if self._remaining is not None:
+                    size = min(size, self._remaining)
+                if size <= 0:
+                    return []
+                claims = claim_many(self._collection, size, lock_field=self._lock_field, **self._claim_kwargs)
+                if self._remaining is not None:
+                    self._remaining -= len(claims)
+                self._buffer.extend(claims)
+            return [self._buffer.popleft() for _ in range(min(n, len(self._buffer)))]
+
+    def release(self) -> None:
+        """Unlock claims that were fetched but never handed out (e.g. max-docs reached)."""
+        with self._mutex:
+            claims = list(self._buffer)
+            self._buffer.clear()
+        unlock_claims(self._collection, claims, lock_field=self._lock_field)
+
+
+def still_locked(collection: Collection, claims: list[Claim], *, lock_field: str) -> list[Claim]:
+    """Return the claims whose lock is still held by their owner (i.e. not yet finished)."""
+    owners = {claim.doc.get("_id"): claim.owner for claim in claims}
+    held = {
+        doc["_id"]
+        for doc in collection.find({"_id": {"$in": list(owners)}}, {lock_field: 1})
+        if (doc.get(lock_field) or {}).get("owner") == owners.get(doc["_id"])
+    }
+    return [claim for claim in claims if claim.doc.get("_id") in held]
+
+
+def unlock_claims(collection: Collection, claims: list[Claim], *, lock_field: str) -> None:
+    by_owner: dict[str, list[Any]] = {}
+    for claim in claims:
+        by_owner.setdefault(claim.owner, []).append(claim.doc.get("_id"))
+    for owner, ids in by_owner.items():
+        collection.update_many(
+            {"_id": {"$in": ids}, f"{lock_field}.owner": owner},
+            {"$unset": {lock_field: ""}},
+        )
 
 
 def unlock_with_error(
@@ -94,6 +197,21 @@ def unlock_with_error(
     )
 
 
+def _finish_update_doc(
+    *,
+    lock_field: str,
+    locale_field: str,
+    target_locale: str,
+    processed_mark_field: str,
+    set_ops: dict[str, Any],
+    unset_lock: bool = True,
+) -> dict[str, Any]:
+    update_doc: dict[str, Any] = {"$set": {**set_ops, locale_field: target_locale, processed_mark_field: utcnow()}}
+    if unset_lock:
+        update_doc["$unset"] = {lock_field: ""}
+    return update_doc
+
+
 def apply_patch_and_finish(
     collection: Collection,
     *,
@@ -106,12 +224,51 @@ def apply_patch_and_finish(
     set_ops: dict[str, Any],
     unset_lock: bool = True,
 ) -> int:
-    update_doc: dict[str, Any] = {"$set": {**set_ops, locale_field: target_locale, processed_mark_field: utcnow()}}
-    if unset_lock:
-        update_doc["$unset"] = {lock_field: ""}
-
     res = collection.update_one(
         filter={"_id": _id, f"{lock_field}.owner": owner},
-        update=update_doc,
+        update=_finish_update_doc(
+            lock_field=lock_field,
+            locale_field=locale_field,
+            target_locale=target_locale,
+            processed_mark_field=processed_mark_field,
+            set_ops=set_ops,
+            unset_lock=unset_lock,
+        ),
+    )
+    return int(res.modified_count)
+
+
+def patch_and_finish_op(
+    *,
+    _id: Any,
+    lock_field: str,
+    owner: str,
+    locale_field: str,
+    target_locale: str,
+    processed_mark_field: str,
+    set_ops: dict[str, Any],
+    unset_lock: bool = True,
+) -> UpdateOne:
+    """Build the same update as apply_patch_and_finish, for use with apply_patches_bulk."""
+    return UpdateOne(
+        filter={"_id": _id, f"{lock_field}.owner": owner},
+        update=_finish_update_doc(
+            lock_field=lock_field,
+            locale_field=locale_field,
+            target_locale=target_locale,
+            processed_mark_field=processed_mark_field,
+            set_ops=set_ops,
+            unset_lock=unset_lock,
+        ),
     )
+
+
+def apply_patches_bulk(collection: Collection, ops: list[UpdateOne]) -> int:
+    """Write a batch of patches in one round-trip; returns the number of modified docs.
+
+    Unordered, so one failed update (e.g. lost lock) doesn't stop the rest.
+    """
+    if not ops:
+        return 0
+    res = collection.bulk_write(ops, ordered=False)
     return int(res.modified_count)
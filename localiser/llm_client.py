@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import atexit
+import functools
+import importlib.util
 import json
 import re
+import threading
+import time
 from dataclasses import dataclass
 from typing import Any
 
 import httpx
+import orjson
 
 
 @dataclass(frozen=True)
@@ -15,17 +21,37 @@ class LlmSettings:
     api_key: str | None
     timeout_s: int
     temperature: float
+    # Pooled connections to the LLM server; size this to the number of workers.
+    max_connections: int = 1
+    # Stream the completion and parse the JSON object as soon as it has fully arrived.
+    stream: bool = True
 
 
 class LlmError(RuntimeError):
     pass
 
 
+class LlmResponseError(LlmError):
+    """The server answered, but the content wasn't the JSON we asked for."""
+
+
+_COMMENT_RE_LINE = re.compile(r"(?m)^\s*//.*$")
+_COMMENT_RE_TAIL = re.compile(r"(?m)\s+//.*$")
+_FENCE_HEAD = re.compile(r"^```[a-zA-Z0-9_-]*\n")
+_FENCE_TAIL = re.compile(r"\n```\s*$")
+_BRACE_GREEDY = re.compile(r"\{[\s\S]*\}")
+# HTTP/2 needs the optional `h2` package (httpx[http2]); without it we stay on HTTP/1.1.
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# orjson has no raw_decode, so locating the object in noisy output stays on the stdlib decoder.
+_DECODER = json.JSONDecoder()
+
+
 def _strip_json_comments(s: str) -> str:
     # Remove // comments (model sometimes emits them).
     # This is a best-effort heuristic; we keep it conservative.
-    s = re.sub(r"(?m)^\s*//.*$", "", s)
-    s = re.sub(r"(?m)\s+//.*$", "", s)
+    s = _COMMENT_RE_LINE.sub("", s)
+    s = _COMMENT_RE_TAIL.sub("", s)
     return s
 
 
@@ -44,50 +70,161 @@ def _extract_json_object(text: str) -> str:
     s = text.strip()
     if s.startswith("```"):
         # remove leading fence line and trailing fence
-        s = re.sub(r"^```[a-zA-Z0-9_-]*\n", "", s)
-        s = re.sub(r"\n```\s*$", "", s)
+        s = _FENCE_HEAD.sub("", s)
+        s = _FENCE_TAIL.sub("", s)
         s = s.strip()
 
     s = _strip_json_comments(s).strip()
 
-    # Fast-path: already pure JSON object.
-    if s.startswith("{"):
-        try:
-            json.loads(s)
-            return s
-        except Exception:
-            pass
+    # Fast-path: decode once from the first brace, which is all well-formed output needs.
+    first = s.find("{")
+    if first == -1:
+        return s
+    try:
+        obj, end = _DECODER.raw_decode(s, first)
+        if isinstance(obj, dict):
+            return s[first:end]
+    except json.JSONDecodeError:
+        pass
 
     # Robust extraction: find the first balanced JSON object using the JSON decoder.
-    decoder = json.JSONDecoder()
-    idx = 0
+    idx = first + 1
     while True:
         brace = s.find("{", idx)
         if brace == -1:
             break
         try:
-            obj, end = decoder.raw_decode(s[brace:])
+            obj, end = _DECODER.raw_decode(s, brace)
             if isinstance(obj, dict):
-                return s[brace : brace + end]
-        except Exception:
-            idx = brace + 1
-            continue
+                return s[brace:end]
+        except json.JSONDecodeError:
+            pass
         idx = brace + 1
 
-    # Last resort: greedy brace capture (may still fail at json.loads call site)
-    m = re.search(r"\{[\s\S]*\}", s)
+    # Last resort: greedy brace capture (may still fail at orjson.loads call site)
+    m = _BRACE_GREEDY.search(s)
     if m:
         return m.group(0).strip()
 
     return s
 
 
+@functools.lru_cache(maxsize=8)
 def _headers(api_key: str | None) -> dict[str, str]:
     if not api_key:
         return {}
     return {"Authorization": f"Bearer {api_key}"}
 
 
+_clients: dict[LlmSettings, httpx.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(settings: LlmSettings) -> httpx.Client:
+    """Return the shared client for these settings so connections are kept alive between calls.
+
+    Creation is serialised so workers making their first call together share one client.
+    """
+    with _clients_lock:
+        client = _clients.get(settings)
+        if client is None:
+            client = _clients[settings] = _new_client(settings)
+            atexit.register(client.close)
+        return client
+
+
+def _new_client(settings: LlmSettings) -> httpx.Client:
+    # HTTP/2 is negotiated per connection, so servers without it (LM Studio serves plain
+    # HTTP/1.1) just keep using HTTP/1.1 over the pooled keep-alive connections.
+    return httpx.Client(
+        http2=_HTTP2_AVAILABLE,
+        timeout=settings.timeout_s,
+        headers=_headers(settings.api_key),
+        limits=httpx.Limits(
+            max_keepalive_connections=settings.max_connections,
+            max_connections=settings.max_connections,
+            keepalive_expiry=60,
+        ),
+    )
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# How long to keep draining a stream after the JSON object has parsed.
+_STREAM_DRAIN_S = 2.0
+
+
+def _stream_chat(client: httpx.Client, url: str, payload: dict[str, Any]) -> tuple[str, Any]:
+    """POST a streaming completion; return (content, parsed object or None).
+
+    Content deltas are accumulated and, whenever a chunk could close the object, decoded
+    from the first `{`. Once that yields a JSON object the remaining events (normally just
+    the finish_reason chunk and `[DONE]`) are drained without parsing, so the connection
+    goes back to the pool; if the server keeps generating past _STREAM_DRAIN_S we stop
+    reading and let that connection close. If the server ignores `stream` and answers
+    with a plain JSON body, its message content is returned instead.
+    """
+    parts: list[str] = []
+    body: list[str] = []
+    parsed: Any = None
+    drain_deadline = 0.0
+    with client.stream("POST", url, content=orjson.dumps(payload), headers=_JSON_HEADERS) as resp:
+        resp.raise_for_status()
+        # Read to the end of the body (don't stop at [DONE]) so httpx can reuse the connection.
+        for line in resp.iter_lines():
+            if parsed is not None:
+                if time.monotonic() > drain_deadline:
+                    break
+                continue
+            if not line.startswith("data:"):
+                body.append(line)
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                continue
+            try:
+                chunk = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                continue
+            if not isinstance(chunk, dict):
+                continue
+            if chunk.get("error"):
+                raise LlmError(f"LLM stream returned an error: {chunk['error']}")
+            # Usage-only and provider preamble chunks carry no choices/delta; skip them.
+            choices = chunk.get("choices")
+            if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict):
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if not delta or not isinstance(delta, str):
+                continue
+            parts.append(delta)
+
+            # The object can only have completed in a chunk containing a closing brace.
+            if "}" not in delta:
+                continue
+            content = "".join(parts)
+            first = content.find("{")
+            if first == -1:
+                continue
+            try:
+                obj, _ = _DECODER.raw_decode(content, first)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(obj, dict):
+                parsed = obj
+                drain_deadline = time.monotonic() + _STREAM_DRAIN_S
+
+    if parsed is not None:
+        return "".join(parts), parsed
+
+    if parts:
+        return "".join(parts), None
+
+    try:
+        return orjson.loads("\n".join(body))["choices"][0]["message"]["content"], None
+    except Exception as e:
+        raise LlmResponseError(f"Unexpected LLM response shape: {e}") from e
+
+
 def chat_completion_json(
     *,
     settings: LlmSettings,
@@ -98,7 +235,7 @@ def chat_completion_json(
 
     url = settings.base_url.rstrip("/") + "/chat/completions"
     # Note: some LM Studio builds/models do not support `response_format`.
-    # We enforce JSON-only via prompting and then `json.loads`.
+    # We enforce JSON-only via prompting and then `orjson.loads`.
     payload = {
         "model": settings.model,
         "temperature": settings.temperature,
@@ -108,23 +245,32 @@ def chat_completion_json(
         ],
     }
 
-    try:
-        with httpx.Client(timeout=settings.timeout_s, headers=_headers(settings.api_key)) as client:
-            resp = client.post(url, json=payload)
+    if settings.stream:
+        try:
+            content, parsed = _stream_chat(_get_client(settings), url, {**payload, "stream": True})
+        except LlmError:
+            raise
+        except Exception as e:  # pragma: no cover
+            raise LlmError(f"LLM request failed: {e}") from e
+        if parsed is not None:
+            return parsed
+    else:
+        try:
+            resp = _get_client(settings).post(url, content=orjson.dumps(payload), headers=_JSON_HEADERS)
             resp.raise_for_status()
-            data = resp.json()
-    except Exception as e:  # pragma: no cover
-        raise LlmError(f"LLM request failed: {e}") from e
+            data = orjson.loads(resp.content)
+        except Exception as e:  # pragma: no cover
+            raise LlmError(f"LLM request failed: {e}") from e
 
-    try:
-        content = data["choices"][0]["message"]["content"]
-    except Exception as e:
-        raise LlmError(f"Unexpected LLM response shape: {e}") from e
+        try:
+            content = data["choices"][0]["message"]["content"]
+        except Exception as e:
+            raise LlmResponseError(f"Unexpected LLM response shape: {e}") from e
 
     try:
         extracted = _extract_json_object(content)
-        return json.loads(extracted)
+        return orjson.loads(extracted)
     except Exception as e:
-        raise LlmError(
+        raise LlmResponseError(
             f"LLM did not return valid JSON: {e}. Raw content: {content[:500]}"
         ) from e
@@ -1,34 +1,136 @@
 from __future__ import annotations
 
-import json
+import functools
+import re
 from typing import Any
 
-from bson import json_util
+import orjson
 
-from .llm_client import LlmSettings, chat_completion_json
+from .llm_client import LlmResponseError, LlmSettings, chat_completion_json
+from .validate import _is_internal_field
 
 class TranslationError(RuntimeError):
     pass
 
-def build_system_prompt(*, source_locale: str, target_locale: str, locale_field: str) -> str:
+class BatchTranslationError(TranslationError):
+    """A multi-document response couldn't be used; each document may be retried alone."""
+
+# Strings matching these are never user-facing text, so they don't need the LLM.
+_URL_RE = re.compile(r"^https?://\S*$", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_HEX_TOKEN_RE = re.compile(r"^(?:0x)?[0-9a-fA-F]{8,}$")
+_PLACEHOLDER_RE = re.compile(r"\{\{[^{}]*\}\}|\$\{[^{}]*\}|\{[^{}]*\}|%[sd]")
+
+def _is_translatable_string(value: str) -> bool:
+    v = value.strip()
+    if _URL_RE.match(v) or _EMAIL_RE.match(v) or _HEX_TOKEN_RE.match(v):
+        return False
+    # Placeholders-only, numeric or empty strings have no words to translate.
+    return any(c.isalpha() for c in _PLACEHOLDER_RE.sub("", v))
+
+def _collect_translatable_leaves(
+    doc: dict[str, Any], locale_field: str
+) -> list[tuple[str, tuple[str | int, ...], str]]:
+    """Return (path, keys, text) for string leaves that may need translating.
+
+    Paths use the same notation as validate._walk_diff (`a.b[0].c`); keys are the
+    dict keys / list indexes leading to the leaf, used to splice translations back in.
+    """
+    found: list[tuple[str, tuple[str | int, ...], str]] = []
+
+    def visit(value: Any, path: str, keys: tuple[str | int, ...]) -> None:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                visit(v, f"{path}.{k}" if path else k, keys + (k,))
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                visit(v, f"{path}[{i}]", keys + (i,))
+        elif isinstance(value, str):
+            if path in (locale_field, "_id") or _is_internal_field(path):
+                return
+            if _is_translatable_string(value):
+                found.append((path, keys, value))
+
+    visit(doc, "", ())
+    return found
+
+def has_translatable_strings(doc: dict[str, Any], *, locale_field: str) -> bool:
+    return bool(_collect_translatable_leaves(doc, locale_field))
+
+def _splice_translations(
+    doc: dict[str, Any],
+    leaves: list[tuple[str, tuple[str | int, ...], str]],
+    translated: Any,
+) -> dict[str, Any]:
+    """Return a copy of `doc` with the translated strings written back at their paths.
+
+    Only the containers along translated paths are copied; everything else is shared
+    with the original document.
+    """
+    if not isinstance(translated, dict):
+        raise TranslationError("LLM response must be a JSON object of path -> text")
+    expected = {path for path, _, _ in leaves}
+    if set(translated.keys()) != expected:
+        missing = sorted(expected - set(translated.keys()))
+        extra = sorted(set(translated.keys()) - expected)
+        raise TranslationError(f"LLM changed the set of paths (missing={missing}, extra={extra})")
+
+    out = dict(doc)
+    copied = {id(out)}
+    for path, keys, _ in leaves:
+        text = translated[path]
+        if not isinstance(text, str):
+            raise TranslationError(f"LLM returned a non-string value for {path}")
+        node: Any = out
+        for key in keys[:-1]:
+            child = node[key]
+            if id(child) not in copied:
+                child = dict(child) if isinstance(child, dict) else list(child)
+                copied.add(id(child))
+                node[key] = child
+            node = child
+        node[keys[-1]] = text
+    return out
+
+def _translation_rules(*, target_locale: str) -> str:
     return (
-        "You are a careful localisation assistant. "
-        "You will receive a MongoDB document as JSON. "
-        f"The document's current locale is {source_locale}. "
         f"Translate ALL user-facing text into German appropriate for {target_locale}. "
         "User-facing text includes titles, labels, descriptions, button text, headings, and end-user messages. "
         "If a string is already German, keep it as-is. If a string is English, translate it. "
-        "You MUST translate at least one user-facing string when any exist; do not return the document unchanged. "
-        "Do NOT change any non-user-facing content such as identifiers, codes, URLs, emails, hashes, tokens, timestamps, or configuration. "
-        "Do NOT change JSON keys or the structure (objects/arrays). "
-        "Do NOT change numbers, booleans, nulls. "
+        "You MUST translate at least one user-facing string when any exist; do not return the text unchanged. "
+        "Do NOT change any non-user-facing content such as identifiers, codes, URLs, emails, hashes, tokens, timestamps, or configuration; return those values unchanged. "
+        "The keys are field paths in the document (e.g. items[0].label); use them as context but NEVER change them. "
         "Preserve placeholders exactly (e.g. {name}, ${amount}, {{var}}, %s, %d). "
         "Preserve markup: keep HTML/Markdown tags and translate only visible text. "
-        f"Do not modify the locale field '{locale_field}' in the returned document; it will be set by the application. "
         "Return STRICT JSON (no markdown, no code fences, no comments, no trailing commas). "
-        "Respond ONLY with a single valid JSON object. "
-        "The JSON you return must be EXACTLY the same shape as the input document (same keys, same arrays). "
-        "Do not wrap it in any outer object. Do not add any keys. "
+    )
+
+@functools.lru_cache(maxsize=8)
+def build_system_prompt(*, source_locale: str, target_locale: str) -> str:
+    return (
+        "You are a careful localisation assistant. "
+        "You will receive a JSON object mapping field paths of a MongoDB document to the text at each path. "
+        f"The document's current locale is {source_locale}. "
+        + _translation_rules(target_locale=target_locale)
+        + "Respond ONLY with a single valid JSON object. "
+        "The JSON you return must have EXACTLY the same keys as the input, with each value translated as needed. "
+        "Do not wrap it in any outer object. Do not add or remove any keys. "
+        "Output MUST be only the JSON object and nothing else."
+    )
+
+@functools.lru_cache(maxsize=8)
+def build_batch_system_prompt(*, source_locale: str, target_locale: str) -> str:
+    return (
+        "You are a careful localisation assistant. "
+        'You will receive a JSON object of the form {"documents": [ ... ]} holding several MongoDB documents; '
+        "each document is a JSON object mapping field paths to the text at each path. "
+        f"Every document's current locale is {source_locale}. "
+        "Translate each document independently. "
+        + _translation_rules(target_locale=target_locale)
+        + 'Respond ONLY with a single valid JSON object of the form {"documents": [ ... ]}. '
+        "The array must contain exactly one translated document per input document, in the same order. "
+        "Each translated document must have EXACTLY the same keys as its input document. "
+        "Do not add or remove any keys. "
         "Output MUST be only the JSON object and nothing else."
     )
 
@@ -44,17 +146,22 @@ def _json_default(o: Any):
     # Fallback
     return str(o)
 
-def build_user_prompt(*, doc: dict[str, Any]) -> str:
-    # Use MongoDB/BSON-aware JSON conversion so types like datetime/ObjectId are serialisable.
-    # This is for prompt transport only; it does not alter the record.
-    # Explicitly include the required top-level key set to reduce accidental key drops/additions.
-    keys = sorted(list(doc.keys()))
+def build_user_prompt(*, strings: dict[str, str]) -> str:
+    # Only the translatable string leaves are sent, keyed by path; ids, numbers, dates and
+    # other structure never reach the prompt.
     return (
         "Translate this document following the rules above.\n"
-        "You MUST return a JSON object with EXACTLY these top-level keys (no more, no less):\n"
-        + json.dumps(keys, ensure_ascii=False)
-        + "\nDocument JSON:\n"
-        + json_util.dumps(doc, ensure_ascii=False)
+        "Document JSON:\n"
+        + orjson.dumps(strings).decode()
+    )
+
+def build_batch_user_prompt(*, documents: list[dict[str, str]]) -> str:
+    # Same transport as build_user_prompt, but several documents share one request.
+    return (
+        "Translate these documents following the rules above.\n"
+        f"There are {len(documents)} documents; return exactly {len(documents)} in the same order.\n"
+        "Documents JSON:\n"
+        + orjson.dumps({"documents": documents}).decode()
     )
 
 def translate_document(
@@ -65,16 +172,87 @@ def translate_document(
     target_locale: str,
     locale_field: str,
 ) -> dict[str, Any]:
-    system_prompt = build_system_prompt(
-        source_locale=source_locale, target_locale=target_locale, locale_field=locale_field
-    )
-    user_prompt = build_user_prompt(doc=doc)
+    leaves = _collect_translatable_leaves(doc, locale_field)
+    # Nothing user-facing to translate: skip the LLM round-trip entirely.
+    if not leaves:
+        return doc
+
+    system_prompt = build_system_prompt(source_locale=source_locale, target_locale=target_locale)
+    user_prompt = build_user_prompt(strings={path: text for path, _, text in leaves})
 
     result = chat_completion_json(settings=llm, system_prompt=system_prompt, user_prompt=user_prompt)
 
-    # We now require the model to return the translated document directly as a JSON object
-    # (no wrapper keys like translated_document/changed_paths/notes).
-    if not isinstance(result, dict):
-        raise TranslationError("LLM response must be a single JSON object")
+    return _splice_translations(doc, leaves, result)
+
+
+def translate_documents(
+    *,
+    docs: list[dict[str, Any]],
+    llm: LlmSettings,
+    source_locale: str,
+    target_locale: str,
+    locale_field: str,
+) -> list[dict[str, Any] | Exception]:
+    """Translate several documents with a single LLM call.
+
+    Returns one result per document, aligned with `docs`: the translated document or the
+    error for that document. Documents without translatable strings are never sent and
+    come back unchanged, whatever happens to the LLM call. If a multi-document response
+    can't be used, the sent documents get a BatchTranslationError (as do individual
+    documents whose translations can't be spliced back) so callers can retry them alone
+    with translate_document.
+    """
+    leaves_by_doc = [_collect_translatable_leaves(doc, locale_field) for doc in docs]
+    pending = [i for i, leaves in enumerate(leaves_by_doc) if leaves]
+    results: list[dict[str, Any] | Exception] = list(docs)
+
+    if len(pending) == 1:
+        i = pending[0]
+        try:
+            results[i] = translate_document(
+                doc=docs[i],
+                llm=llm,
+                source_locale=source_locale,
+                target_locale=target_locale,
+                locale_field=locale_field,
+            )
+        except Exception as e:
+            results[i] = e
+        return results
+    if not pending:
+        return results
+
+    system_prompt = build_batch_system_prompt(source_locale=source_locale, target_locale=target_locale)
+    user_prompt = build_batch_user_prompt(
+        documents=[{path: text for path, _, text in leaves_by_doc[i]} for i in pending]
+    )
+
+    try:
+        try:
+            result = chat_completion_json(
+                settings=llm, system_prompt=system_prompt, user_prompt=user_prompt
+            )
+
+            translated = result.get("documents") if isinstance(result, dict) else None
+            if not isinstance(translated, list):
+                raise TranslationError("LLM batch response must be an object with a 'documents' array")
+            if len(translated) != len(pending):
+                raise TranslationError(
+                    f"LLM batch response has {len(translated)} documents, expected {len(pending)}"
+                )
+
+        except (TranslationError, LlmResponseError) as e:
+            raise BatchTranslationError(str(e)) from e
+    except Exception as e:
+        # Request failures and unusable batch responses only concern the documents we sent.
+        for i in pending:
+            results[i] = e
+        return results
 
-    return result
+    # Keep every document that spliced cleanly; only the bad ones need retrying alone.
+    for i, t in zip(pending, translated):
+        try:
+            results[i] = _splice_translations(docs[i], leaves_by_doc[i], t)
+        except TranslationError as e:
+            results[i] = BatchTranslationError(str(e))
+    return results
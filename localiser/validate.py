@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Iterator
+from typing import Any
 
 
 @dataclass(frozen=True)
@@ -14,51 +14,59 @@ class ValidationError(RuntimeError):
     pass
 
 
+_INTERNAL_EXACT = frozenset({"_ts"})
+_INTERNAL_PREFIX = "_localiser"
+
+
 def _is_internal_field(path: str) -> bool:
     # Ignore app-managed / system fields that may not be present in LLM output or
     # may appear with different serialisation types (e.g. BSON dates).
     # When dict key sets differ, our diff uses a synthetic "{keys}" suffix.
-    return path.startswith("_localiser") or path in {"_ts"}
-
+    return path in _INTERNAL_EXACT or path.startswith(_INTERNAL_PREFIX)
 
-def _is_primitive(v: Any) -> bool:
-    return v is None or isinstance(v, (str, int, float, bool))
 
+def _walk_diff(original: Any, translated: Any, path: str) -> list[tuple[str, Any, Any]]:
+    """Return (path, original_value, translated_value) for any difference, in document order.
 
-def _walk_diff(original: Any, translated: Any, path: str) -> Iterator[tuple[str, Any, Any]]:
-    """Yield (path, original_value, translated_value) for any difference."""
-    if type(original) is not type(translated):
-        yield (path, original, translated)
-        return
+    Iterative (explicit stack) rather than recursive so wide/deep documents don't pay for
+    a generator frame per node.
+    """
+    diffs: list[tuple[str, Any, Any]] = []
+    stack: list[tuple[Any, Any, str]] = [(original, translated, path)]
+    while stack:
+        o, t, p = stack.pop()
+        # Untouched subtrees are shared with the original (see translator._splice_translations),
+        # so identity is enough to skip them. Don't use `==` here: it treats 1, 1.0 and True
+        # as equal and would hide type changes inside a subtree.
+        if o is t:
+            continue
+        if type(o) is not type(t):
+            diffs.append((p, o, t))
+            continue
 
-    if isinstance(original, dict):
-        okeys = set(original.keys())
-        tkeys = set(translated.keys())
-        if okeys != tkeys:
-            yield (path + "{keys}", okeys, tkeys)
-            return
-        for k in original.keys():
-            child_path = f"{path}.{k}" if path else k
-            yield from _walk_diff(original[k], translated[k], child_path)
-        return
+        if isinstance(o, dict):
+            # Key views compare in C; only build sets when the keys actually differ.
+            if len(o) != len(t) or o.keys() != t.keys():
+                diffs.append((p + "{keys}", set(o.keys()), set(t.keys())))
+                continue
+            # Push in reverse so children are visited (and reported) in key order.
+            for k in reversed(o.keys()):
+                stack.append((o[k], t[k], f"{p}.{k}" if p else k))
+            continue
 
-    if isinstance(original, list):
-        if len(original) != len(translated):
-            yield (path + "{len}", len(original), len(translated))
-            return
-        for i, (ov, tv) in enumerate(zip(original, translated)):
-            child_path = f"{path}[{i}]"
-            yield from _walk_diff(ov, tv, child_path)
-        return
+        if isinstance(o, list):
+            if len(o) != len(t):
+                diffs.append((p + "{len}", len(o), len(t)))
+                continue
+            for i in range(len(o) - 1, -1, -1):
+                stack.append((o[i], t[i], f"{p}[{i}]"))
+            continue
 
-    if _is_primitive(original):
-        if original != translated:
-            yield (path, original, translated)
-        return
+        # Primitives and unknown types alike: a difference is a plain inequality.
+        if o != t:
+            diffs.append((p, o, t))
 
-    # Unknown types: treat as mismatch if not equal
-    if original != translated:
-        yield (path, original, translated)
+    return diffs
 
 
 def validate_and_build_patch(
@@ -106,8 +114,8 @@ def validate_and_build_patch(
                 missing = set(ov) - set(tv)
                 extra = set(tv) - set(ov)
                 if missing or extra:
-                    if all(str(k).startswith("_localiser") for k in missing) and all(
-                        str(k).startswith("_localiser") for k in extra
+                    if all(str(k).startswith(_INTERNAL_PREFIX) for k in missing) and all(
+                        str(k).startswith(_INTERNAL_PREFIX) for k in extra
                     ):
                         continue
             raise ValidationError(f"Structure changed at {path}")